@@ -0,0 +1,78 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Precompiles js/src/jit/CacheIROps.yaml into _cacheir_ops_data.py so that
+# header generation can import the parsed op list instead of running the
+# preprocessor and PyYAML on every build. Run from a configured build
+# environment (buildconfig and mozbuild must be importable).
+
+import os
+import sys
+import tempfile
+
+JIT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "mozjs", "js", "src", "jit",
+)
+sys.path.insert(0, JIT_DIR)
+
+try:
+    from GenerateCacheIRFiles import defines_hash, load_precompiled, load_yaml
+except ImportError as e:
+    # The precompile helpers are added to the vendored generator by a patch
+    # in etc/patches; a fresh SpiderMonkey checkout does not have them until
+    # etc/update.py has applied the patches. Any other ImportError (most
+    # likely buildconfig/mozbuild outside a configured build environment)
+    # is not ours to diagnose, so let it propagate.
+    if e.name != "GenerateCacheIRFiles":
+        raise
+    raise SystemExit(
+        "GenerateCacheIRFiles.py is missing its precompile helpers; "
+        "run etc/update.py so the patches in etc/patches are applied."
+    )
+
+MODULE_HEADER = """\
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# This file is generated by etc/precompile_cacheir.py from CacheIROps.yaml.
+# Do not edit!
+
+from collections import OrderedDict
+
+DEFINES_HASH = "%s"
+
+DATA = [
+"""
+
+
+def main():
+    yaml_path = os.path.join(JIT_DIR, "CacheIROps.yaml")
+    py_path = os.path.join(JIT_DIR, "_cacheir_ops_data.py")
+
+    # load_precompiled applies the same freshness rules the generator uses at
+    # build time (mtime and build-defines hash), so the module is only
+    # reported up to date if it would actually be loaded.
+    if load_precompiled(yaml_path) is not None:
+        print("%s is up to date." % py_path)
+        return
+
+    data = load_yaml(yaml_path)
+
+    # Write via a temp file and os.replace so an interrupted run cannot leave
+    # a newer-mtime but truncated module behind.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(py_path), suffix=".py.tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(MODULE_HEADER % defines_hash())
+        for op in data:
+            f.write("    %r,\n" % op)
+        f.write("]\n")
+    os.replace(tmp_path, py_path)
+
+    print("Wrote %s." % py_path)
+
+
+if __name__ == "__main__":
+    main()
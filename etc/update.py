@@ -5,6 +5,7 @@
 import os
 import shutil
 import subprocess
+import tarfile
 import tempfile
 
 TARGET = "mozjs"
@@ -16,7 +17,10 @@ def extract_tarball(tarball, commit):
         raise Exception("Tarball not found at %s" % tarball)
 
     with tempfile.TemporaryDirectory() as directory:
-        subprocess.check_call(["tar", "-xf", tarball, "-C", directory])
+        # Extract in-process rather than shelling out to tar; the "data"
+        # filter refuses members that would escape the target directory.
+        with tarfile.open(tarball) as tf:
+            tf.extractall(directory, filter="data")
 
         contents = os.listdir(directory)
         if len(contents) != 1:
@@ -36,8 +40,12 @@ def extract_tarball(tarball, commit):
         ])
 
     if commit:
-        subprocess.check_call(["git", "add", "--all", TARGET], stdout=subprocess.DEVNULL)
-        subprocess.check_call(["git", "commit", "-m", "Update SpiderMonkey"], stdout=subprocess.DEVNULL)
+        # Stage and commit with a single subprocess. The update flow already
+        # requires a POSIX environment for rsync above.
+        subprocess.check_call(
+            ["sh", "-c",
+             "git add --all %s && git commit -m 'Update SpiderMonkey'" % TARGET],
+            stdout=subprocess.DEVNULL)
 
 def apply_patches():
     print("Applying patches.")
@@ -47,6 +55,28 @@ def apply_patches():
         for p in os.listdir(patch_dir)
         if p.endswith(".patch")
     )
+    if not patches:
+        return
+
+    # Fast path: feed every patch to git apply as one concatenated stream.
+    # Unlike passing multiple paths, the stream form chains the patches, so
+    # its dry run validates each patch against the tree as left by the
+    # previous ones and agrees exactly with what the real apply will do.
+    contents = b"".join(open(p, "rb").read() for p in patches)
+    batch = ["git", "apply", "--directory=" + TARGET]
+    check = subprocess.run(batch + ["--check", "-"], input=contents,
+                           stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL)
+    if check.returncode == 0:
+        for p in patches:
+            print("  Applying patch: %s." % p)
+        subprocess.run(batch + ["-"], input=contents, check=True,
+                       stdout=subprocess.DEVNULL)
+        return
+
+    # Something does not apply cleanly; fall back to one patch at a time
+    # against the untouched tree, so the failing patch is identified and
+    # later patches are not attempted against a partially patched tree.
     for p in patches:
         print("  Applying patch: %s." % p)
         subprocess.check_call(["git", "apply", "--reject", "--directory=" + TARGET, p], stdout=subprocess.DEVNULL)
@@ -4,52 +4,120 @@
 
 # This script generates jit/CacheIROpsGenerated.h from CacheIROps.yaml
 
+import functools
+import hashlib
+import importlib.util
+import io
+import os
+import shutil
+import tempfile
+
 import buildconfig
 import yaml
-import six
 from collections import OrderedDict
 from mozbuild.preprocessor import Preprocessor
 
-HEADER_TEMPLATE = """\
-/* This Source Code Form is subject to the terms of the Mozilla Public
- * License, v. 2.0. If a copy of the MPL was not distributed with this
- * file, You can obtain one at http://mozilla.org/MPL/2.0/. */
-
-#ifndef %(includeguard)s
-#define %(includeguard)s
-
-/* This file is generated by jit/GenerateCacheIRFiles.py. Do not edit! */
-
-%(contents)s
+# Prefer the libyaml-backed loader; it is much faster than the pure-Python
+# one and not all PyYAML installs ship it.
+try:
+    from yaml import CSafeLoader as _BaseLoader
+except ImportError:
+    from yaml import SafeLoader as _BaseLoader
 
-#endif // %(includeguard)s
-"""
 
-
-def generate_header(c_out, includeguard, contents):
+def write_header(c_out, includeguard, sections):
+    """Streams the generated header to c_out: the license and include-guard
+    prologue, then each (#define, methods) section, then the epilogue. The
+    sections are written piecewise so the header is never assembled as one
+    large string."""
     c_out.write(
-        HEADER_TEMPLATE
-        % {
-            "includeguard": includeguard,
-            "contents": contents,
-        }
+        "/* This Source Code Form is subject to the terms of the Mozilla Public\n"
+        " * License, v. 2.0. If a copy of the MPL was not distributed with this\n"
+        " * file, You can obtain one at http://mozilla.org/MPL/2.0/. */\n"
+        "\n"
+        f"#ifndef {includeguard}\n"
+        f"#define {includeguard}\n"
+        "\n"
+        "/* This file is generated by jit/GenerateCacheIRFiles.py. Do not edit! */\n"
+        "\n"
     )
+    for define, methods in sections:
+        c_out.write(define)
+        c_out.write("\\\n".join(methods))
+        c_out.write("\n\n")
+    c_out.write(f"\n\n#endif // {includeguard}\n")
+
+
+def prune_cache_files(cache_dir, prefix, suffix, keep_path):
+    """Removes cache files in cache_dir matching prefix/suffix, except
+    keep_path. Entries for superseded YAML/defines states are never read
+    again, so delete them rather than letting them pile up."""
+    keep_name = os.path.basename(keep_path)
+    try:
+        entries = os.listdir(cache_dir)
+    except OSError:
+        return
+    for entry in entries:
+        if (
+            entry != keep_name
+            and entry.startswith(prefix)
+            and entry.endswith(suffix)
+        ):
+            try:
+                os.remove(os.path.join(cache_dir, entry))
+            except OSError:
+                # Another build may have removed it already.
+                pass
+
+
+def preprocess_yaml(yaml_path, cache_dir=None):
+    """Run the build preprocessor over the YAML file so that we can use
+    #ifdef JS_SIMULATOR in it, and return the resulting text.
+
+    When cache_dir is given (the objdir, next to the generated header), the
+    preprocessed text is cached there keyed by the source path and mtime and
+    the build defines, so unchanged rebuilds skip the preprocessor entirely.
+    Any YAML edit (mtime) or build-define change picks a different cache
+    file."""
+    cache_path = None
+    if cache_dir is not None:
+        yaml_path_abs = os.path.abspath(yaml_path)
+        key = hashlib.md5(
+            (
+                yaml_path_abs
+                + str(os.path.getmtime(yaml_path_abs))
+                + defines_hash()
+            ).encode()
+        ).hexdigest()
+        cache_path = os.path.join(cache_dir, f"CacheIROps.{key}.pp")
+        if os.path.exists(cache_path):
+            with open(cache_path) as cached:
+                return cached.read()
 
-
-def load_yaml(yaml_path):
-    # First invoke preprocessor.py so that we can use #ifdef JS_SIMULATOR in
-    # the YAML file.
     pp = Preprocessor()
     pp.context.update(buildconfig.defines["ALLDEFINES"])
-    pp.out = six.StringIO()
+    pp.out = io.StringIO()
     pp.do_filter("substitution")
     pp.do_include(yaml_path)
     contents = pp.out.getvalue()
 
+    if cache_path is not None:
+        prune_cache_files(cache_dir, "CacheIROps.", ".pp", cache_path)
+        # Write the cache file atomically so a concurrent build cannot observe
+        # a partially written entry.
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".pp.tmp")
+        with os.fdopen(fd, "w") as tmp:
+            tmp.write(contents)
+        os.replace(tmp_path, cache_path)
+
+    return contents
+
+
+def parse_yaml(contents):
     # Load into an OrderedDict to ensure order is preserved. Note: Python 3.7+
     # also preserves ordering for normal dictionaries.
     # Code based on https://stackoverflow.com/a/21912744.
-    class OrderedLoader(yaml.Loader):
+    class OrderedLoader(_BaseLoader):
         pass
 
     def construct_mapping(loader, node):
@@ -61,6 +129,48 @@ def load_yaml(yaml_path):
     return yaml.load(contents, OrderedLoader)
 
 
+def load_yaml(yaml_path):
+    return parse_yaml(preprocess_yaml(yaml_path))
+
+
+def defines_hash():
+    """Hash of the build defines the YAML preprocessing depends on."""
+    defines = buildconfig.defines["ALLDEFINES"]
+    return hashlib.md5(repr(sorted(defines.items())).encode()).hexdigest()
+
+
+def load_precompiled(yaml_path):
+    """Load the op list from the module written by etc/precompile_cacheir.py.
+
+    Returns (data, key_bytes) where key_bytes identifies the module contents
+    for caching purposes, or None when the module is missing, older than the
+    YAML source, or was precompiled against different build defines."""
+    py_path = os.path.join(
+        os.path.dirname(os.path.abspath(yaml_path)), "_cacheir_ops_data.py"
+    )
+    if not os.path.exists(py_path):
+        return None
+    if os.path.getmtime(py_path) < os.path.getmtime(yaml_path):
+        return None
+
+    spec = importlib.util.spec_from_file_location("_cacheir_ops_data", py_path)
+    module = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(module)
+        module_defines_hash = module.DEFINES_HASH
+        data = module.DATA
+    except Exception:
+        # A truncated or otherwise broken module must degrade to the YAML
+        # path, not break header generation.
+        return None
+    if module_defines_hash != defines_hash():
+        return None
+
+    with open(py_path, "rb") as f:
+        key_bytes = f.read()
+    return data, key_bytes
+
+
 # Information for generating CacheIRWriter code for a single argument. Tuple
 # stores the C++ argument type and the CacheIRWriter method to call.
 arg_writer_info = {
@@ -104,56 +214,6 @@ arg_writer_info = {
 }
 
 
-def gen_writer_method(name, args, custom_writer):
-    """Generates a CacheIRWRiter method for a single opcode."""
-
-    # Generate a single method that writes the opcode and each argument.
-    # For example:
-    #
-    #   void guardShape(ObjOperandId obj, Shape* shape) {
-    #     writeOp(CacheOp::GuardShape);
-    #     writeOperandId(obj);
-    #     writeShapeField(shape);
-    #     assertLengthMatches();
-    #  }
-    #
-    # The assertLengthMatches() call is to assert the information in the
-    # arg_length dictionary below matches what's written.
-
-    # Method names start with a lowercase letter.
-    method_name = name[0].lower() + name[1:]
-    if custom_writer:
-        method_name += "_"
-
-    method_args = []
-    ret_type = "void"
-    args_code = ""
-    if args:
-        for arg_name, arg_type in six.iteritems(args):
-            cpp_type, write_method = arg_writer_info[arg_type]
-            if arg_name == "result":
-                ret_type = cpp_type
-                args_code += "  {} result(newOperandId());\\\n".format(cpp_type)
-                args_code += "  writeOperandId(result);\\\n"
-            else:
-                method_args.append("{} {}".format(cpp_type, arg_name))
-                args_code += "  {}({});\\\n".format(write_method, arg_name)
-
-    code = ""
-    if custom_writer:
-        code += "private:\\\n"
-    code += "{} {}({}) {{\\\n".format(ret_type, method_name, ", ".join(method_args))
-    code += "  writeOp(CacheOp::{});\\\n".format(name)
-    code += args_code
-    code += "  assertLengthMatches();\\\n"
-    if ret_type != "void":
-        code += "  return result;\\\n"
-    code += "}"
-    if custom_writer:
-        code += "\\\npublic:"
-    return code
-
-
 # Information for generating code using CacheIRReader for a single argument.
 # Tuple stores the C++ type, the suffix used for arguments/variables of this
 # type, and the expression to read this type from CacheIRReader.
@@ -198,44 +258,6 @@ arg_reader_info = {
 }
 
 
-def gen_compiler_method(name, args):
-    """Generates CacheIRCompiler or WarpCacheIRTranspiler header code for a
-    single opcode."""
-
-    method_name = "emit" + name
-
-    # We generate the signature of the method that needs to be implemented and a
-    # separate function forwarding to it. For example:
-    #
-    #   [[nodiscard]] bool emitGuardShape(ObjOperandId objId, uint32_t shapeOffset);
-    #   [[nodiscard]] bool emitGuardShape(CacheIRReader& reader) {
-    #     ObjOperandId objId = reader.objOperandId();
-    #     uint32_t shapeOffset = reader.stubOffset();
-    #     return emitGuardShape(objId, shapeOffset);
-    #   }
-    cpp_args = []
-    method_args = []
-    args_code = ""
-    if args:
-        for arg_name, arg_type in six.iteritems(args):
-            cpp_type, suffix, readexpr = arg_reader_info[arg_type]
-            cpp_name = arg_name + suffix
-            cpp_args.append(cpp_name)
-            method_args.append("{} {}".format(cpp_type, cpp_name))
-            args_code += "  {} {} = {};\\\n".format(cpp_type, cpp_name, readexpr)
-
-    # Generate signature.
-    code = "[[nodiscard]] bool {}({});\\\n".format(method_name, ", ".join(method_args))
-
-    # Generate the method forwarding to it.
-    code += "[[nodiscard]] bool {}(CacheIRReader& reader) {{\\\n".format(method_name)
-    code += args_code
-    code += "  return {}({});\\\n".format(method_name, ", ".join(cpp_args))
-    code += "}\\\n"
-
-    return code
-
-
 # For each argument type, the method name for printing it.
 arg_spewer_method = {
     "ValId": "spewOperandId",
@@ -278,93 +300,6 @@ arg_spewer_method = {
 }
 
 
-def gen_spewer_method(name, args):
-    """Generates spewer code for a single opcode."""
-
-    method_name = "spew" + name
-
-    # Generate code like this:
-    #
-    #  void spewGuardShape(CacheIRReader& reader) {
-    #     spewOp(CacheOp::GuardShape);
-    #     spewOperandId("objId", reader.objOperandId());
-    #     spewOperandSeparator();
-    #     spewField("shapeOffset", reader.stubOffset());
-    #     spewOpEnd();
-    #  }
-    args_code = ""
-    if args:
-        is_first = True
-        for arg_name, arg_type in six.iteritems(args):
-            _, suffix, readexpr = arg_reader_info[arg_type]
-            arg_name += suffix
-            spew_method = arg_spewer_method[arg_type]
-            if not is_first:
-                args_code += "  spewArgSeparator();\\\n"
-            args_code += '  {}("{}", {});\\\n'.format(spew_method, arg_name, readexpr)
-            is_first = False
-
-    code = "void {}(CacheIRReader& reader) {{\\\n".format(method_name)
-    code += "  spewOp(CacheOp::{});\\\n".format(name)
-    code += args_code
-    code += "  spewOpEnd();\\\n"
-    code += "}\\\n"
-
-    return code
-
-
-def gen_clone_method(name, args):
-    """Generates code for cloning a single opcode."""
-
-    method_name = "clone" + name
-
-    # Generate code like this:
-    #
-    #  void cloneGuardShape(CacheIRReader& reader, CacheIRWriter& writer) {
-    #    writer.writeOp(CacheOp::GuardShape);
-    #    ObjOperandId objId = reader.objOperandId();
-    #    writer.writeOperandId(objId);
-    #    uint32_t shapeOffset = reader.stubOffset();
-    #    Shape* shape = getShapeField(shapeOffset);
-    #    writer.writeShapeField(shape);
-    #    writer.assertLengthMatches();
-    #  }
-
-    args_code = ""
-    if args:
-        for arg_name, arg_type in six.iteritems(args):
-            if arg_type == "RawId":
-                arg_type = "ValId"
-
-            read_type, suffix, readexpr = arg_reader_info[arg_type]
-            read_name = arg_name + suffix
-            value_name = read_name
-            args_code += "  {} {} = {};\\\n".format(read_type, read_name, readexpr)
-
-            write_type, write_method = arg_writer_info[arg_type]
-            if arg_name == "result":
-                args_code += "  writer.newOperandId();\\\n"
-            if suffix == "Offset":
-                # If the write function takes T&, the intermediate variable
-                # should be of type T.
-                if write_type.endswith("&"):
-                    write_type = write_type[:-1]
-                value_name = arg_name
-                args_code += "  {} {} = get{}({});\\\n".format(
-                    write_type, value_name, arg_type, read_name
-                )
-            args_code += "  writer.{}({});\\\n".format(write_method, value_name)
-
-    code = "void {}".format(method_name)
-    code += "(CacheIRReader& reader, CacheIRWriter& writer) {{\\\n"
-    code += "  writer.writeOp(CacheOp::{});\\\n".format(name)
-    code += args_code
-    code += "  writer.assertLengthMatches();\\\n"
-    code += "}}\\\n"
-
-    return code
-
-
 # Length in bytes for each argument type, either an integer or a C++ expression.
 # This is used to generate the CacheIROpArgLengths array. CacheIRWriter asserts
 # the number of bytes written matches the value in that array.
@@ -408,13 +343,230 @@ arg_length = {
     "StaticStringImm": "sizeof(uintptr_t)",
 }
 
+# The same lengths stringified once, so building the args-length expression
+# for each op doesn't call str() per argument.
+arg_length_str = {k: str(v) for k, v in arg_length.items()}
+
+
+@functools.lru_cache(maxsize=None)
+def gen_arg_blocks(args_tuple):
+    """Generates the per-argument code fragments for the writer, compiler,
+    spewer and clone methods of a single opcode, in one pass over the
+    arguments so the arg-type table lookups are shared between them.
+
+    Many ops share an argument signature (for example a single ObjId), so the
+    result is memoized on the args tuple and the fragments are built only
+    once per distinct signature.
+
+    Takes the arguments as a tuple of (name, type) pairs and returns a tuple
+    of strings:
+
+      (writer_sig_args, writer_ret_type, writer_args_code,
+       compiler_sig_args, compiler_cpp_args, compiler_args_code,
+       spewer_args_code, clone_args_code)
+    """
+
+    writer_method_args = []
+    writer_ret_type = "void"
+    writer_parts = []
+
+    compiler_method_args = []
+    compiler_cpp_args = []
+    compiler_parts = []
+
+    spewer_parts = []
+
+    clone_parts = []
+
+    writer_info = arg_writer_info
+    reader_info = arg_reader_info
+    spewer_method = arg_spewer_method
+
+    for arg_name, arg_type in args_tuple:
+        # Writer.
+        cpp_type, write_method = writer_info[arg_type]
+        if arg_name == "result":
+            writer_ret_type = cpp_type
+            writer_parts.append(f"  {cpp_type} result(newOperandId());\\\n")
+            writer_parts.append("  writeOperandId(result);\\\n")
+        else:
+            writer_method_args.append(f"{cpp_type} {arg_name}")
+            writer_parts.append(f"  {write_method}({arg_name});\\\n")
+
+        # Compiler.
+        read_type, suffix, readexpr = reader_info[arg_type]
+        cpp_name = arg_name + suffix
+        compiler_cpp_args.append(cpp_name)
+        compiler_method_args.append(f"{read_type} {cpp_name}")
+        compiler_parts.append(f"  {read_type} {cpp_name} = {readexpr};\\\n")
+
+        # Spewer.
+        spew_method = spewer_method[arg_type]
+        if spewer_parts:
+            spewer_parts.append("  spewArgSeparator();\\\n")
+        spewer_parts.append(f'  {spew_method}("{cpp_name}", {readexpr});\\\n')
+
+        # Clone. RawId arguments are cloned as ValId.
+        clone_type = "ValId" if arg_type == "RawId" else arg_type
+        read_type, suffix, readexpr = reader_info[clone_type]
+        read_name = arg_name + suffix
+        value_name = read_name
+        clone_parts.append(f"  {read_type} {read_name} = {readexpr};\\\n")
+
+        write_type, write_method = writer_info[clone_type]
+        if arg_name == "result":
+            clone_parts.append("  writer.newOperandId();\\\n")
+        if suffix == "Offset":
+            # If the write function takes T&, the intermediate variable
+            # should be of type T.
+            if write_type.endswith("&"):
+                write_type = write_type[:-1]
+            value_name = arg_name
+            clone_parts.append(
+                f"  {write_type} {value_name} = get{clone_type}({read_name});\\\n"
+            )
+        clone_parts.append(f"  writer.{write_method}({value_name});\\\n")
+
+    return (
+        ", ".join(writer_method_args),
+        writer_ret_type,
+        "".join(writer_parts),
+        ", ".join(compiler_method_args),
+        ", ".join(compiler_cpp_args),
+        "".join(compiler_parts),
+        "".join(spewer_parts),
+        "".join(clone_parts),
+    )
+
+
+def gen_op_methods(name, args, custom_writer):
+    """Generates the writer, compiler, spewer and clone code for a single
+    opcode in one traversal of its arguments.
+
+    The writer method writes the opcode and each argument. For example:
+
+      void guardShape(ObjOperandId obj, Shape* shape) {
+        writeOp(CacheOp::GuardShape);
+        writeOperandId(obj);
+        writeShapeField(shape);
+        assertLengthMatches();
+      }
+
+    The assertLengthMatches() call is to assert the information in the
+    arg_length dictionary above matches what's written.
+
+    The compiler code is used both for CacheIRCompiler and
+    WarpCacheIRTranspiler headers: the signature of the method that needs to
+    be implemented and a separate function forwarding to it. For example:
+
+      [[nodiscard]] bool emitGuardShape(ObjOperandId objId, uint32_t shapeOffset);
+      [[nodiscard]] bool emitGuardShape(CacheIRReader& reader) {
+        ObjOperandId objId = reader.objOperandId();
+        uint32_t shapeOffset = reader.stubOffset();
+        return emitGuardShape(objId, shapeOffset);
+      }
+
+    The spewer and clone methods read the operands back out of a
+    CacheIRReader and print them or write them through a CacheIRWriter,
+    respectively.
+
+    Returns (writer_code, compiler_code, spewer_code, clone_code)."""
+
+    (
+        writer_sig_args,
+        writer_ret_type,
+        writer_args_code,
+        compiler_sig_args,
+        compiler_cpp_args,
+        compiler_args_code,
+        spewer_args_code,
+        clone_args_code,
+    ) = gen_arg_blocks(tuple(args.items()) if args else ())
+
+    # Writer method names start with a lowercase letter.
+    writer_name = name[0].lower() + name[1:]
+    if custom_writer:
+        writer_name += "_"
+
+    parts = []
+    if custom_writer:
+        parts.append("private:\\\n")
+    parts.append(f"{writer_ret_type} {writer_name}({writer_sig_args}) {{\\\n")
+    parts.append(f"  writeOp(CacheOp::{name});\\\n")
+    parts.append(writer_args_code)
+    parts.append("  assertLengthMatches();\\\n")
+    if writer_ret_type != "void":
+        parts.append("  return result;\\\n")
+    parts.append("}")
+    if custom_writer:
+        parts.append("\\\npublic:")
+    writer_code = "".join(parts)
+
+    compiler_name = "emit" + name
+    parts = [f"[[nodiscard]] bool {compiler_name}({compiler_sig_args});\\\n"]
+    parts.append(f"[[nodiscard]] bool {compiler_name}(CacheIRReader& reader) {{\\\n")
+    parts.append(compiler_args_code)
+    parts.append(f"  return {compiler_name}({compiler_cpp_args});\\\n")
+    parts.append("}\\\n")
+    compiler_code = "".join(parts)
+
+    parts = [f"void spew{name}(CacheIRReader& reader) {{\\\n"]
+    parts.append(f"  spewOp(CacheOp::{name});\\\n")
+    parts.append(spewer_args_code)
+    parts.append("  spewOpEnd();\\\n")
+    parts.append("}\\\n")
+    spewer_code = "".join(parts)
+
+    parts = [f"void clone{name}"]
+    parts.append("(CacheIRReader& reader, CacheIRWriter& writer) {{\\\n")
+    parts.append(f"  writer.writeOp(CacheOp::{name});\\\n")
+    parts.append(clone_args_code)
+    parts.append("  writer.assertLengthMatches();\\\n")
+    parts.append("}}\\\n")
+    clone_code = "".join(parts)
+
+    return writer_code, compiler_code, spewer_code, clone_code
+
 
 def generate_cacheirops_header(c_out, yaml_path):
     """Generate CacheIROpsGenerated.h from CacheIROps.yaml. The generated file
     contains a list of all CacheIR ops and generated source code for
     CacheIRWriter and CacheIRCompiler."""
 
-    data = load_yaml(yaml_path)
+    # The caches live next to the generated header in the objdir; that keeps
+    # them build-private rather than in a world-shared temp directory.
+    out_name = getattr(c_out, "name", None)
+    cache_dir = (
+        os.path.dirname(os.path.abspath(out_name))
+        if out_name
+        else tempfile.gettempdir()
+    )
+
+    # Prefer the module precompiled from the YAML by etc/precompile_cacheir.py;
+    # it avoids running the preprocessor and PyYAML on every build. Fall back
+    # to the YAML pipeline when it is missing or stale.
+    precompiled = load_precompiled(yaml_path)
+    if precompiled is not None:
+        data, key_bytes = precompiled
+        contents_pp = None
+    else:
+        data = None
+        contents_pp = preprocess_yaml(yaml_path, cache_dir)
+        key_bytes = contents_pp.encode()
+
+    # The generated header is a pure function of the op list, so we cache it
+    # on disk keyed by a hash of its source bytes. Any edit to the YAML (or
+    # to the build defines it depends on) changes the hash and invalidates the
+    # cache automatically.
+    digest = hashlib.blake2b(key_bytes).hexdigest()
+    cache_path = os.path.join(cache_dir, "CacheIROpsGenerated.%s.cache" % digest)
+    if os.path.exists(cache_path):
+        with open(cache_path) as cached:
+            shutil.copyfileobj(cached, c_out)
+        return
+
+    if data is None:
+        data = parse_yaml(contents_pp)
 
     # CACHE_IR_OPS items. Each item stores an opcode name and arguments length
     # expression. For example: _(GuardShape, 1 + 1)
@@ -459,7 +611,7 @@ def generate_cacheirops_header(c_out, yaml_path):
         assert isinstance(custom_writer, bool)
 
         if args:
-            args_length = " + ".join([str(arg_length[v]) for v in args.values()])
+            args_length = " + ".join(arg_length_str[v] for v in args.values())
         else:
             args_length = "0"
 
@@ -468,51 +620,51 @@ def generate_cacheirops_header(c_out, yaml_path):
             "_({}, {}, {}, {})".format(name, args_length, transpile_str, cost_estimate)
         )
 
-        writer_methods.append(gen_writer_method(name, args, custom_writer))
+        writer_code, compiler_code, spewer_code, clone_code = gen_op_methods(
+            name, args, custom_writer
+        )
+
+        writer_methods.append(writer_code)
 
         if shared:
-            compiler_shared_methods.append(gen_compiler_method(name, args))
+            compiler_shared_methods.append(compiler_code)
         else:
-            compiler_unshared_methods.append(gen_compiler_method(name, args))
+            compiler_unshared_methods.append(compiler_code)
 
         if transpile:
-            transpiler_methods.append(gen_compiler_method(name, args))
-            transpiler_ops.append("_({})".format(name))
-
-        spewer_methods.append(gen_spewer_method(name, args))
-
-        clone_methods.append(gen_clone_method(name, args))
-
-    contents = "#define CACHE_IR_OPS(_)\\\n"
-    contents += "\\\n".join(ops_items)
-    contents += "\n\n"
-
-    contents += "#define CACHE_IR_WRITER_GENERATED \\\n"
-    contents += "\\\n".join(writer_methods)
-    contents += "\n\n"
-
-    contents += "#define CACHE_IR_COMPILER_SHARED_GENERATED \\\n"
-    contents += "\\\n".join(compiler_shared_methods)
-    contents += "\n\n"
-
-    contents += "#define CACHE_IR_COMPILER_UNSHARED_GENERATED \\\n"
-    contents += "\\\n".join(compiler_unshared_methods)
-    contents += "\n\n"
-
-    contents += "#define CACHE_IR_TRANSPILER_GENERATED \\\n"
-    contents += "\\\n".join(transpiler_methods)
-    contents += "\n\n"
-
-    contents += "#define CACHE_IR_TRANSPILER_OPS(_)\\\n"
-    contents += "\\\n".join(transpiler_ops)
-    contents += "\n\n"
-
-    contents += "#define CACHE_IR_SPEWER_GENERATED \\\n"
-    contents += "\\\n".join(spewer_methods)
-    contents += "\n\n"
-
-    contents += "#define CACHE_IR_CLONE_GENERATED \\\n"
-    contents += "\\\n".join(clone_methods)
-    contents += "\n\n"
-
-    generate_header(c_out, "jit_CacheIROpsGenerated_h", contents)
+            transpiler_methods.append(compiler_code)
+            transpiler_ops.append(f"_({name})")
+
+        spewer_methods.append(spewer_code)
+
+        clone_methods.append(clone_code)
+
+    sections = [
+        ("#define CACHE_IR_OPS(_)\\\n", ops_items),
+        ("#define CACHE_IR_WRITER_GENERATED \\\n", writer_methods),
+        ("#define CACHE_IR_COMPILER_SHARED_GENERATED \\\n", compiler_shared_methods),
+        (
+            "#define CACHE_IR_COMPILER_UNSHARED_GENERATED \\\n",
+            compiler_unshared_methods,
+        ),
+        ("#define CACHE_IR_TRANSPILER_GENERATED \\\n", transpiler_methods),
+        ("#define CACHE_IR_TRANSPILER_OPS(_)\\\n", transpiler_ops),
+        ("#define CACHE_IR_SPEWER_GENERATED \\\n", spewer_methods),
+        ("#define CACHE_IR_CLONE_GENERATED \\\n", clone_methods),
+    ]
+
+    # Drop cache entries for previous YAML/defines states so a long-lived
+    # objdir keeps at most one snapshot.
+    prune_cache_files(cache_dir, "CacheIROpsGenerated.", ".cache", cache_path)
+
+    # Stream the header straight into the cache file instead of materializing
+    # it as one large string, then hand the cached copy to the build system.
+    # The cache file is written via a temp file and os.replace so an
+    # interrupted build cannot leave a truncated entry behind.
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".cache.tmp")
+    with os.fdopen(fd, "w") as tmp:
+        write_header(tmp, "jit_CacheIROpsGenerated_h", sections)
+    os.replace(tmp_path, cache_path)
+
+    with open(cache_path) as cached:
+        shutil.copyfileobj(cached, c_out)